@@ -5,16 +5,25 @@
 Script for running REST server with endpoints for pre- and postprocessing sentences for Marian NMT
 """
 import argparse
-import codecs
 import configparser
-import json
+import gc
 import logging
+import multiprocessing
+import orjson
+import os
 import re
 import sentencepiece as spm
-
-from sacremoses import MosesPunctNormalizer, MosesTruecaser, MosesDetruecaser
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from functools import lru_cache
+from itertools import repeat
+from typing import Optional
+
+from sacremoses import MosesTruecaser, MosesDetruecaser
 from subword_nmt.apply_bpe import BPE, read_vocabulary
-from tokenizeExtended import MosesTokenizerExtended, MosesDetokenizerExtended
+from tokenizeExtended import MosesPunctNormalizerExtended, MosesTokenizerExtended, MosesDetokenizerExtended
 
 __authors__ = ["Jörg Steffen, DFKI"]
 
@@ -28,23 +37,45 @@ logging.basicConfig(
 logger = logging.getLogger(__file__)
 logger.setLevel(logging.INFO)
 
-# the configuration, read from config.ini
-configuration = None
 
-# translation directions for which a section in config exists
-supported_trans_dirs = []
+@dataclass
+class TransDirConfig:
+    """
+    Processing options and tools of a translation direction
+    """
 
-# misc tools, initialized in init function;
-# language independent:
+    # the translation direction, e.g. 'de-en'
+    trans_dir: str
+    # subtokenization type, None if no subtokenization is applied
+    subtok_type: Optional[str]
+    # boolean processing options, read from config.ini
+    replace_unicode_punctuation: bool
+    escape_xml_symbols: bool
+    aggressive_hyphen_splitting: bool
+    # tools of source language
+    punct_normalizer: MosesPunctNormalizerExtended
+    tokenizer: MosesTokenizerExtended
+    # tools of target language
+    detokenizer: MosesDetokenizerExtended
+    # translation direction dependent tools, None if not provided
+    truecaser: Optional[MosesTruecaser]
+    bpe_encoder: Optional[BPE]
+    sentence_piece: Optional[spm.SentencePieceProcessor]
+
+
+# config of each translation direction for which a section in config exists, initialized in init function
+trans_dir_configs = {}
+
+# detruecaser, initialized in init function; it is language independent
 moses_detruecaser = None
-# language dependent:
-moses_punct_normalizer = {}
-moses_tokenizer = {}
-moses_detokenizer = {}
-# translation direction dependent
-moses_truecaser = {}
-bpe_encoder = {}
-sentence_piece = {}
+
+# process pool for processing sentence batches in parallel, initialized in init function;
+# None if batches are processed sequentially
+batch_pool = None
+# number of worker processes of the batch pool
+batch_processes = 1
+# lock guarding the replacement of a broken batch pool
+batch_pool_lock = threading.Lock()
 
 # Flask app
 app = Flask(__name__)
@@ -53,6 +84,20 @@ app = Flask(__name__)
 ST_BPE = "BPE"
 ST_SENTENCE_PIECE = "SENTENCE_PIECE"
 
+# names of the boolean processing options of a translation direction
+BOOLEAN_OPTIONS = ['replace_unicode_punctuation', 'escape_xml_symbols', 'aggressive_hyphen_splitting']
+
+# pattern matching the whitespace following a token that contains an Okapi tag marker
+OKAPI_TAG_MERGE_PATTERN = re.compile('([\uE101\uE102\uE103]\\S*) ')
+# pattern matching an Okapi tag, i.e. a tag marker followed by the tag index character
+OKAPI_TAG_PATTERN = re.compile('([\uE101\uE102\uE103].)')
+
+# maximum number of byte pair encoded sentences to cache
+BPE_CACHE_SIZE = 10000
+
+# number of sentences of a batch processed together by a single worker process
+BATCH_CHUNK_SIZE = 16
+
 
 @app.route('/alive')
 def alive():
@@ -70,118 +115,193 @@ def preprocess():
     :return: preprocessing result
     """
 
-    if 'trans_dir' not in request.args:
-        error_message = "missing translation direction"
-        logger.error(error_message)
-        abort(400, description=error_message)
-    trans_dir = request.args.get('trans_dir', type=str).lower()
-    if trans_dir not in supported_trans_dirs:
-        error_message = f"translation direction '{trans_dir}' not supported"
-        logger.error(error_message)
-        abort(400, description=error_message)
-
-    # get subtokenization type
-    subtok_type = None
-    if trans_dir in bpe_encoder:
-        subtok_type = ST_BPE
-    elif trans_dir in sentence_piece:
-        subtok_type = ST_SENTENCE_PIECE
+    trans_dir_config = get_trans_dir_config()
 
     if request.method == 'GET':
-        if 'sentence' not in request.args:
-            error_message = "missing sentence"
-            logger.error(error_message)
-            abort(400, description=error_message)
-        sentence = request.args.get('sentence', type=str)
-        preprocessed_sentence = preprocess_sentence(sentence, trans_dir, subtok_type)
+        sentence = get_required_arg('sentence', "missing sentence")
+        preprocessed_sentence = preprocess_sentence(sentence, trans_dir_config)
         return Response(preprocessed_sentence, status=200, mimetype='text/plain')
 
     elif request.method == 'POST':
-        if request.mimetype != 'application/json':
-            # use mimetype since we don't need the other information provided by content_type
-            error_message = f"Invalid content-type '{request.mimetype}'. Must be application/json."
-            logger.error(error_message)
-            abort(400, description=error_message)
-        sentences = request.get_json()
-        preprocessed_sentences = []
-        for sentence in sentences:
-            preprocessed_sentences.append(preprocess_sentence(sentence, trans_dir, subtok_type))
-        preprocessed_sentences_as_json = json.dumps(preprocessed_sentences)
-        return Response(preprocessed_sentences_as_json, status=200, mimetype='application/json')
+        sentences = get_json_sentences()
+        preprocessed_sentences = process_batch(preprocess_sentences, sentences, trans_dir_config)
+        preprocessed_sentences_as_json = orjson.dumps(preprocessed_sentences)
+        return Response(preprocessed_sentences_as_json, status=200, content_type='application/json; charset=utf-8')
 
 
-def preprocess_sentence(sentence, trans_dir, subtok_type):
+def preprocess_sentence(sentence, trans_dir_config):
     """
     Preprocess the given sentence for the given translation direction.
     :param sentence: the sentence to preprocess
-    :param trans_dir: the translation direction
-    :param subtok_type: the subtokenization type
+    :param trans_dir_config: the config of the translation direction
     :return: preprocessed sentence
     """
 
-    # extract source language from translation direction
-    source_lang = trans_dir.split('-')[0]
+    return preprocess_sentences([sentence], trans_dir_config)[0]
 
-    # normalize punctuation; this is translation direction dependent
-    normalizer = moses_punct_normalizer[source_lang]
-    if configuration[trans_dir].getboolean('replace_unicode_punctuation'):
-        sentence = normalizer.replace_unicode_punct(sentence)
-    sentence = normalizer.normalize(sentence)
-    sentence_as_tokens = sentence.split()
 
-    if subtok_type == ST_BPE:
-        # tokenize; this is language dependent
-        tokenizer = moses_tokenizer[source_lang]
-        escape_xml_symbols = configuration[trans_dir].getboolean('escape_xml_symbols')
-        aggressive_hyphen_splitting = configuration[trans_dir].getboolean('aggressive_hyphen_splitting')
-        # a single Okapi tag is split into two tokens
-        sentence_as_tokens = \
-            tokenizer.tokenize(sentence,
-                               escape=escape_xml_symbols,
-                               aggressive_dash_splits=aggressive_hyphen_splitting)
-
-    if trans_dir in moses_truecaser:
-        # truecasing; this is translation direction dependent
-        truecaser = moses_truecaser[trans_dir]
-        # remove Okapi tags at beginning of sentence before truecasing and re-add them afterwards
-        removed_tokens = []
-        while True:
-            if len(sentence_as_tokens) > 1:
-                first_token = sentence_as_tokens[0]
-                if re.search(r"\uE101", first_token) \
-                        or re.search(r"\uE102", first_token) \
-                        or re.search(r"\uE103", first_token):
-                    removed_tokens.extend(sentence_as_tokens[0:2])
-                    del sentence_as_tokens[0:2]
-                    continue
-            break
-        sentence_as_tokens = truecaser.truecase(' '.join(sentence_as_tokens))
-        sentence_as_tokens = removed_tokens + sentence_as_tokens
-        sentence = ' '.join(sentence_as_tokens)
-
-    if subtok_type == ST_BPE:
-        # byte pair encoding; this is translation direction dependent
-        encoder = bpe_encoder[trans_dir]
-        sentence_as_tokens = encoder.process_line(sentence).split()
-        # merge each Okapi tag into a single token
-        sentence = ''
-        for token in sentence_as_tokens:
-            if re.search(r"\uE101", token) or re.search(r"\uE102", token) or re.search(r"\uE103", token):
-                sentence += token
-            else:
-                sentence += token + ' '
-        sentence = sentence.strip()
-    elif subtok_type == ST_SENTENCE_PIECE:
+def preprocess_sentences(sentences, trans_dir_config):
+    """
+    Preprocess the given sentences for the given translation direction.
+    :param sentences: the sentences to preprocess
+    :param trans_dir_config: the config of the translation direction
+    :return: list of preprocessed sentences
+    """
+
+    if trans_dir_config.subtok_type == ST_BPE:
+        # byte pair encoding; this is translation direction dependent;
+        # works directly on the tokens, so they don't have to be joined and split again
+        return [merge_okapi_tags(apply_bpe(tuple(apply_moses_tokenization(sentence, trans_dir_config)),
+                                           trans_dir_config.trans_dir))
+                for sentence in sentences]
+    sentences = [apply_moses(sentence, trans_dir_config) for sentence in sentences]
+    if trans_dir_config.subtok_type == ST_SENTENCE_PIECE:
         # SentencePiece subtokenization; this is translation direction dependent
-        sp = sentence_piece[trans_dir]
-        # tags must be surrounded by whitespace
-        sentence = re.sub('([\uE101\uE102\uE103].)', r' \1 ', sentence)
-        sentence_as_tokens = sp.encode(sentence, out_type=str)
+        return apply_sentence_piece(sentences, trans_dir_config.sentence_piece)
+    return sentences
+
+
+def apply_moses(sentence, trans_dir_config):
+    """
+    Apply Moses punctuation normalization and truecasing to the given sentence
+    for the given translation direction; used if no BPE subtokenization is applied.
+    :param sentence: the sentence to process
+    :param trans_dir_config: the config of the translation direction
+    :return: processed sentence
+    """
+
+    sentence = normalize_punctuation(sentence, trans_dir_config)
+    if trans_dir_config.truecaser is None:
+        return sentence
+    return ' '.join(truecase(sentence.split(), trans_dir_config.truecaser))
+
+
+def apply_moses_tokenization(sentence, trans_dir_config):
+    """
+    Apply Moses punctuation normalization, tokenization and truecasing to the given sentence
+    for the given translation direction; used for BPE subtokenization.
+    :param sentence: the sentence to process
+    :param trans_dir_config: the config of the translation direction
+    :return: list of processed sentence tokens
+    """
+
+    sentence = normalize_punctuation(sentence, trans_dir_config)
+    # tokenize; this is language dependent
+    # a single Okapi tag is split into two tokens
+    sentence_as_tokens = \
+        trans_dir_config.tokenizer.tokenize(
+            sentence,
+            escape=trans_dir_config.escape_xml_symbols,
+            aggressive_dash_splits=trans_dir_config.aggressive_hyphen_splitting)
+    if trans_dir_config.truecaser is None:
+        return sentence_as_tokens
+    return truecase(sentence_as_tokens, trans_dir_config.truecaser)
+
+
+def normalize_punctuation(sentence, trans_dir_config):
+    """
+    Apply Moses punctuation normalization to the given sentence for the given translation direction.
+    :param sentence: the sentence to normalize
+    :param trans_dir_config: the config of the translation direction
+    :return: normalized sentence
+    """
+
+    # this is language dependent
+    normalizer = trans_dir_config.punct_normalizer
+    if trans_dir_config.replace_unicode_punctuation:
+        sentence = normalizer.replace_unicode_punct(sentence)
+    return normalizer.normalize(sentence)
+
+
+def truecase(sentence_as_tokens, truecaser):
+    """
+    Apply truecasing to the given sentence tokens.
+    :param sentence_as_tokens: the sentence tokens
+    :param truecaser: the truecaser of the translation direction
+    :return: list of truecased sentence tokens
+    """
+
+    # this is translation direction dependent
+    # remove Okapi tags at beginning of sentence before truecasing and re-add them afterwards;
+    # a single Okapi tag is split into two tokens
+    removed_tokens, sentence_as_tokens = split_leading_okapi_tags(sentence_as_tokens, 2)
+    return removed_tokens + truecaser.truecase(' '.join(sentence_as_tokens))
+
+
+def apply_sentence_piece(sentences, sentence_piece):
+    """
+    Apply SentencePiece subtokenization to the given sentences. All sentences are encoded in a single call.
+    :param sentences: the sentences to encode
+    :param sentence_piece: the SentencePiece processor of the translation direction
+    :return: list of encoded sentences, with subtokens separated by single spaces
+    """
+
+    # tags must be surrounded by whitespace
+    sentences = [OKAPI_TAG_PATTERN.sub(r' \1 ', sentence) if contains_okapi_tag(sentence) else sentence
+                 for sentence in sentences]
+    # encode repeated sentences only once
+    unique_sentences = list(dict.fromkeys(sentences))
+    encoded_sentences = {}
+    for sentence, sentence_as_tokens in zip(
+            unique_sentences, sentence_piece.encode(unique_sentences, out_type=str)):
         # remove orphaned underscores
-        sentence_as_tokens = list(filter(lambda tok: tok != '\u2581', sentence_as_tokens))
-        sentence = ' '.join(sentence_as_tokens)
+        sentence_as_tokens = [token for token in sentence_as_tokens if token != '\u2581']
+        encoded_sentences[sentence] = ' '.join(sentence_as_tokens)
+    return [encoded_sentences[sentence] for sentence in sentences]
+
+
+def contains_okapi_tag(text):
+    """
+    Check if the given text contains an Okapi tag marker.
+    Plain substring tests are used, as they are much cheaper than a regex search
+    and the vast majority of tokens does not contain a tag.
+    :param text: the text to check
+    :return: True if the text contains an Okapi tag marker, False otherwise
+    """
+
+    # Okapi tag markers: opening, closing, isolated
+    return '\uE101' in text or '\uE102' in text or '\uE103' in text
+
+
+def split_leading_okapi_tags(tokens, tokens_per_tag):
+    """
+    Split the given tokens into the Okapi tags at the beginning of the sentence and the remaining tokens.
+    The scan stops when fewer than two tokens remain; with two tokens per tag, all tokens may be removed.
+    :param tokens: the sentence tokens
+    :param tokens_per_tag: the number of tokens a single Okapi tag consists of
+    :return: tuple of leading Okapi tag tokens and remaining tokens
+    """
+
+    tags_end = 0
+    while len(tokens) - tags_end > 1 and contains_okapi_tag(tokens[tags_end]):
+        tags_end += tokens_per_tag
+    return tokens[:tags_end], tokens[tags_end:]
+
+
+def merge_okapi_tags(sentence):
+    """
+    Merge each Okapi tag in the given space separated sentence into a single token,
+    i.e. remove the space following each token that contains an Okapi tag marker.
+    :param sentence: the sentence with tokens separated by single spaces
+    :return: sentence with merged Okapi tags
+    """
+
+    if not contains_okapi_tag(sentence):
+        return sentence
+    return OKAPI_TAG_MERGE_PATTERN.sub(r'\1', sentence)
+
+
+@lru_cache(maxsize=BPE_CACHE_SIZE)
+def apply_bpe(tokens, trans_dir):
+    """
+    Apply byte pair encoding to the given sentence tokens for the given translation direction.
+    Results are cached, as the same sentences (headers, boilerplate) are frequently repeated.
+    :param tokens: the sentence tokens as tuple, so they can be used as cache key
+    :param trans_dir: the translation direction
+    :return: byte pair encoded sentence, with subtokens separated by single spaces
+    """
 
-    return sentence
+    return ' '.join(trans_dir_configs[trans_dir].bpe_encoder.segment_tokens(tokens))
 
 
 @app.route('/postprocess', methods=['GET', 'POST'])
@@ -191,86 +311,197 @@ def postprocess():
     :return: postprocessing result
     """
 
-    if 'trans_dir' not in request.args:
-        error_message = "missing translation direction"
-        logger.error(error_message)
-        abort(400, description=error_message)
-    trans_dir = request.args.get('trans_dir', type=str)
-    if trans_dir not in supported_trans_dirs:
-        error_message = f"translation direction '{trans_dir}' not supported"
-        logger.error(error_message)
-        abort(400, description=error_message)
-
-    # get subtokenization type
-    subtok_type = None
-    if trans_dir in bpe_encoder:
-        subtok_type = ST_BPE
-    elif trans_dir in sentence_piece:
-        subtok_type = ST_SENTENCE_PIECE
+    trans_dir_config = get_trans_dir_config()
 
     if request.method == 'GET':
-        if 'sentence' not in request.args:
-            error_message = "missing sentence"
-            logger.error(error_message)
-            abort(400, description=error_message)
-        sentence = request.args.get('sentence', type=str)
-        postprocessed_sentence = postprocess_sentence(sentence, trans_dir, subtok_type)
+        sentence = get_required_arg('sentence', "missing sentence")
+        postprocessed_sentence = postprocess_sentence(sentence, trans_dir_config)
         return Response(postprocessed_sentence, status=200, mimetype='text/plain')
 
     elif request.method == 'POST':
-        if request.mimetype != 'application/json':
-            # use mimetype since we don't need the other information provided by content_type
-            error_message = f"Invalid content-type '{request.mimetype}'. Must be application/json."
-            logger.error(error_message)
-            abort(400, description=error_message)
-        sentences = request.get_json()
-        postprocessed_sentences = []
-        for sentence in sentences:
-            postprocessed_sentences.append(postprocess_sentence(sentence, trans_dir, subtok_type))
-        postprocessed_sentences_as_json = json.dumps(postprocessed_sentences)
-        return Response(postprocessed_sentences_as_json, status=200, mimetype='application/json')
+        sentences = get_json_sentences()
+        postprocessed_sentences = process_batch(postprocess_sentences, sentences, trans_dir_config)
+        postprocessed_sentences_as_json = orjson.dumps(postprocessed_sentences)
+        return Response(postprocessed_sentences_as_json, status=200, content_type='application/json; charset=utf-8')
 
 
-def postprocess_sentence(sentence, trans_dir, subtok_type):
+def postprocess_sentence(sentence, trans_dir_config):
     """
     Postprocess the given sentence for the given translation direction.
     :param sentence: the sentence to postprocess
-    :param trans_dir: the translation direction
-    :param subtok_type: the subtokenization type
+    :param trans_dir_config: the config of the translation direction
     :return: postprocessed sentence
     """
 
-    # extract target language from translation direction
-    target_lang = trans_dir.split('-')[1]
+    # only apply detruecasing if truecasing was applied in preprocessing
+    truecased = trans_dir_config.truecaser is not None
+    if not truecased and trans_dir_config.subtok_type != ST_BPE:
+        # neither detruecasing nor detokenization, so the sentence doesn't have to be split
+        return sentence
 
     sentence_as_tokens = sentence.split()
-    # only apply detruecasing if truecasing was applied in preprocessing
-    if trans_dir in moses_truecaser:
+    if truecased:
         # detruecasing; this is language independent
         # remove Okapi tags at beginning of sentence before detruecasing and re-add them afterwards;
         # single Okapi tag is ONE token, in contrast to preprocessing
-        removed_tokens = []
-        while True:
-            if len(sentence_as_tokens) > 1:
-                first_token = sentence_as_tokens[0]
-                if re.search(r"\uE101", first_token) \
-                        or re.search(r"\uE102", first_token) \
-                        or re.search(r"\uE103", first_token):
-                    removed_tokens.extend(sentence_as_tokens[0:1])
-                    del sentence_as_tokens[0:1]
-                    continue
-            break
-        sentence_as_tokens = moses_detruecaser.detruecase(' '.join(sentence_as_tokens))
-        sentence_as_tokens = removed_tokens + sentence_as_tokens
-        sentence = ' '.join(sentence_as_tokens)
-
-    if subtok_type == ST_BPE:
+        removed_tokens, sentence_as_tokens = split_leading_okapi_tags(sentence_as_tokens, 1)
+        sentence_as_tokens = removed_tokens + moses_detruecaser.detruecase(' '.join(sentence_as_tokens))
+
+    if trans_dir_config.subtok_type == ST_BPE:
         # detokenize; this is language dependent
-        detokenizer = moses_detokenizer[target_lang]
-        unescape_xml_symbols = configuration[trans_dir].getboolean('escape_xml_symbols')
-        sentence = detokenizer.detokenize(sentence_as_tokens, unescape=unescape_xml_symbols)
+        return trans_dir_config.detokenizer.detokenize(
+            sentence_as_tokens, unescape=trans_dir_config.escape_xml_symbols)
+    return ' '.join(sentence_as_tokens)
+
+
+def postprocess_sentences(sentences, trans_dir_config):
+    """
+    Postprocess the given sentences for the given translation direction.
+    :param sentences: the sentences to postprocess
+    :param trans_dir_config: the config of the translation direction
+    :return: list of postprocessed sentences
+    """
+
+    return [postprocess_sentence(sentence, trans_dir_config) for sentence in sentences]
+
+
+def bad_request(error_message):
+    """
+    Log the given error message and abort the current request with status 400 and the message as description.
+    Error messages are only built on the error path, as arguments of this function.
+    :param error_message: the error message
+    :return:
+    """
+
+    logger.error(error_message)
+    abort(400, description=error_message)
+
+
+def get_required_arg(name, error_message):
+    """
+    Get the value of the given request argument; aborts the request if the argument is missing.
+    :param name: the argument name
+    :param error_message: the error message used if the argument is missing
+    :return: the argument value
+    """
+
+    value = request.args.get(name, type=str)
+    if value is None:
+        bad_request(error_message)
+    return value
+
+
+def get_trans_dir_config():
+    """
+    Get the config of the translation direction from the request arguments; aborts the request
+    if the translation direction is missing or not supported.
+    :return: the config of the lowercased translation direction
+    """
+
+    trans_dir = get_required_arg('trans_dir', "missing translation direction").lower()
+    trans_dir_config = trans_dir_configs.get(trans_dir)
+    if trans_dir_config is None:
+        bad_request(f"translation direction '{trans_dir}' not supported")
+    return trans_dir_config
+
+
+def get_json_sentences():
+    """
+    Get the sentences from the JSON body of the request; aborts the request if it has no JSON content type
+    or the body is not valid JSON.
+    :return: the list of sentences
+    """
+
+    if request.mimetype != 'application/json':
+        # use mimetype since we don't need the other information provided by content_type
+        bad_request(f"Invalid content-type '{request.mimetype}'. Must be application/json.")
+    # orjson is considerably faster than the json module used by request.get_json()
+    try:
+        return orjson.loads(request.get_data())
+    except orjson.JSONDecodeError as e:
+        bad_request(f"Invalid JSON: {e}")
+
+
+def process_batch(process_function, sentences, trans_dir_config):
+    """
+    Apply the given batch processing function to all given sentences. If a process pool is available,
+    the sentences are split into chunks that are distributed over the pool's worker processes.
+    :param process_function: the function to apply, either preprocess_sentences or postprocess_sentences
+    :param sentences: the sentences to process
+    :param trans_dir_config: the config of the translation direction
+    :return: list of processed sentences, in the same order as the given sentences
+    """
+
+    pool = batch_pool
+    if pool is not None and len(sentences) > BATCH_CHUNK_SIZE:
+        chunks = [sentences[i:i + BATCH_CHUNK_SIZE] for i in range(0, len(sentences), BATCH_CHUNK_SIZE)]
+        try:
+            # only the name of the translation direction is sent to the worker processes,
+            # they look up the config with its tools themselves
+            processed_chunks = pool.map(
+                process_chunk, repeat(process_function), chunks, repeat(trans_dir_config.trans_dir))
+            return [sentence for chunk in processed_chunks for sentence in chunk]
+        except BrokenProcessPool:
+            # a worker process died, e.g. killed by the OOM killer; fail this request
+            # and replace the pool so that following requests can be processed again
+            logger.error("batch pool worker process terminated abruptly, recreating batch pool")
+            replace_broken_batch_pool(pool)
+            raise
+    return process_function(sentences, trans_dir_config)
+
+
+def process_chunk(process_function, sentences, trans_dir):
+    """
+    Apply the given batch processing function to the given chunk of a sentence batch;
+    runs in a worker process of the batch pool.
+    :param process_function: the function to apply, either preprocess_sentences or postprocess_sentences
+    :param sentences: the sentences of the chunk
+    :param trans_dir: the translation direction
+    :return: list of processed sentences
+    """
+
+    return process_function(sentences, trans_dir_configs[trans_dir])
+
+
+def create_batch_pool():
+    """
+    Create the process pool for sentence batches and start all its worker processes.
+    :return: the process pool
+    """
+
+    # worker processes are forked, so they inherit the initialized tools of this process
+    pool = ProcessPoolExecutor(max_workers=batch_processes, mp_context=multiprocessing.get_context('fork'))
+    # the first task forks all worker processes
+    pool.submit(int).result()
+    return pool
+
+
+def replace_broken_batch_pool(broken_pool):
+    """
+    Replace the given broken batch pool by a new one, unless another thread already did so.
+    :param broken_pool: the broken batch pool
+    :return:
+    """
 
-    return sentence
+    global batch_pool
+    with batch_pool_lock:
+        if batch_pool is broken_pool:
+            broken_pool.shutdown(wait=False)
+            batch_pool = create_batch_pool()
+
+
+def available_cpu_count():
+    """
+    Get the number of CPUs this process may run on. In contrast to os.cpu_count(),
+    this respects CPU affinity restrictions, e.g. the cpuset of a container;
+    CPU quotas, e.g. set with docker --cpus, are NOT taken into account.
+    :return: the number of available CPUs
+    """
+
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    # sched_getaffinity is not available on all platforms
+    return os.cpu_count()
 
 
 def init(config, config_folder):
@@ -281,64 +512,111 @@ def init(config, config_folder):
     :return:
     """
 
-    global configuration
-    configuration = config
-
-    global supported_trans_dirs
+    global trans_dir_configs
 
     # detruecaser is language independent
     global moses_detruecaser
     moses_detruecaser = MosesDetruecaser()
 
-    # punctuation normalizer, tokenizer and detokenizer are language dependent
-    global moses_punct_normalizer
-    global moses_tokenizer
-    global moses_detokenizer
-    # truecaser, byte pair encoderand SentencePiece are translation direction dependent;
-    # truecaser depends on the corpus on which the translation model was trained
-    # and is therefore considered translation direction dependent
-    global moses_truecaser
-    global bpe_encoder
-    global sentence_piece
-
+    # process pool for sentence batches
+    global batch_pool
+    global batch_processes
+    # shut down the pool of a previous initialization; its workers still hold the previous tools
+    with batch_pool_lock:
+        if batch_pool is not None:
+            batch_pool.shutdown()
+            batch_pool = None
+
+    # punctuation normalizer, tokenizer and detokenizer are language dependent;
+    # they are shared between all translation directions with the same language
+    moses_punct_normalizer = {}
+    moses_tokenizer = {}
+    moses_detokenizer = {}
+
+    trans_dir_configs = {}
     for trans_dir in config.sections():
         trans_dir = trans_dir.lower()
-        supported_trans_dirs.append(trans_dir)
+        source_lang, target_lang = trans_dir.split('-')
         logger.info(f"initializing for '{trans_dir}'...")
 
-        for lang in trans_dir.split('-'):
+        for lang in [source_lang, target_lang]:
             # initialize punctuation normalizer, tokenizer and detokenizer ONCE for each language
             if lang not in moses_punct_normalizer:
-                moses_punct_normalizer[lang] = MosesPunctNormalizer(lang=lang)
+                moses_punct_normalizer[lang] = MosesPunctNormalizerExtended(lang=lang)
                 moses_tokenizer[lang] = MosesTokenizerExtended(lang=lang)
                 moses_detokenizer[lang] = MosesDetokenizerExtended(lang=lang)
 
+        # truecaser, byte pair encoder and SentencePiece are translation direction dependent;
+        # truecaser depends on the corpus on which the translation model was trained
+        # and is therefore considered translation direction dependent
+
         # truecaser
+        truecaser = None
         truecaser_model_path = config[trans_dir]['truecaser_model'].strip()
         if len(truecaser_model_path) > 0:
-            moses_truecaser[trans_dir] = MosesTruecaser(f"{config_folder}/{truecaser_model_path}")
+            truecaser = MosesTruecaser(f"{config_folder}/{truecaser_model_path}")
         else:
             logger.info(f"no truecaser model provided for '{trans_dir}'")
 
         # BPE encoder
+        bpe_encoder = None
         bpe_codes_path = config[trans_dir]['bpe_codes'].strip()
         if len(bpe_codes_path) > 0:
             vocab_path = f"{config[trans_dir]['bpe_vocabulary']}".strip()
             vocab = None
             if len(vocab_path) > 0:
-                vocab = read_vocabulary(codecs.open(f"{config_folder}/{vocab_path}", encoding='utf-8'), None)
+                with open(f"{config_folder}/{vocab_path}", encoding='utf-8') as vocab_file:
+                    vocab = read_vocabulary(vocab_file, None)
             else:
                 logger.info(f"no BPE vocabulary provided for '{trans_dir}'")
-            bpe_encoder[trans_dir] = BPE(
-                codecs.open(f"{config_folder}/{bpe_codes_path}", encoding='utf-8'),
-                vocab=vocab)
+            with open(f"{config_folder}/{bpe_codes_path}", encoding='utf-8') as bpe_codes_file:
+                bpe_encoder = BPE(bpe_codes_file, vocab=vocab)
 
         # SentencePiece
+        sentence_piece = None
         sentence_piece_model_path = config[trans_dir]['sentencepiece_model'].strip()
         if len(sentence_piece_model_path) > 0:
-            sp = spm.SentencePieceProcessor()
-            sp.Load(f"{config_folder}/{sentence_piece_model_path}")
-            sentence_piece[trans_dir] = sp
+            sentence_piece = spm.SentencePieceProcessor()
+            sentence_piece.Load(f"{config_folder}/{sentence_piece_model_path}")
+
+        # subtokenization type
+        subtok_type = None
+        if bpe_encoder is not None:
+            subtok_type = ST_BPE
+        elif sentence_piece is not None:
+            subtok_type = ST_SENTENCE_PIECE
+
+        # processing options are parsed once here instead of on each request
+        trans_dir_configs[trans_dir] = TransDirConfig(
+            trans_dir=trans_dir,
+            subtok_type=subtok_type,
+            **{option: config[trans_dir].getboolean(option) for option in BOOLEAN_OPTIONS},
+            punct_normalizer=moses_punct_normalizer[source_lang],
+            tokenizer=moses_tokenizer[source_lang],
+            detokenizer=moses_detokenizer[target_lang],
+            truecaser=truecaser,
+            bpe_encoder=bpe_encoder,
+            sentence_piece=sentence_piece)
+
+    # cached byte pair encodings were created with the previous encoders
+    apply_bpe.cache_clear()
+
+    # process pool for sentence batches; worker processes are forked AFTER all tools are initialized,
+    # so they inherit them from this process instead of loading them again
+    batch_processes = config['DEFAULT'].getint('batch_processes', fallback=1)
+    if batch_processes == 0:
+        batch_processes = available_cpu_count()
+    if batch_processes > 1 and 'fork' not in multiprocessing.get_all_start_methods():
+        # worker processes must be forked to inherit the tools, e.g. not supported on Windows
+        logger.warning("forking processes is not supported on this platform, processing sentence batches sequentially")
+        batch_processes = 1
+    if batch_processes > 1:
+        # move all objects created so far to the permanent generation ignored by the garbage collector;
+        # otherwise garbage collections in the workers write to the inherited tools' object headers,
+        # so copy-on-write duplicates their memory pages in each worker
+        gc.freeze()
+        batch_pool = create_batch_pool()
+        logger.info(f"processing sentence batches with {batch_processes} processes")
 
     logger.info("initialization done")
 
@@ -370,7 +648,13 @@ def main(config_folder, port):
         app.run(host=host, port=port, debug=False)
     elif mode == 'production':
         from waitress import serve
-        serve(app, host=host, port=port)
+        # number of threads handling requests concurrently; while a thread waits for a batch
+        # processed in the process pool, the other threads keep serving new requests
+        threads = config['DEFAULT'].getint('server_threads', fallback=0)
+        if threads == 0:
+            # one thread per CPU, but at least as many as the waitress default
+            threads = max(available_cpu_count(), 4)
+        serve(app, host=host, port=port, threads=threads)
     else:
         logger.error(f"unsupported server mode {mode}")
 
@@ -1,8 +1,16 @@
 import re
 
-from six import text_type
+from sacremoses import MosesPunctNormalizer, MosesTokenizer, MosesDetokenizer
 
-from sacremoses import MosesTokenizer, MosesDetokenizer
+
+def compile_substitution(substitution):
+    """
+    Compile the regular expression of the given substitution.
+    :param substitution: tuple of regular expression string and replacement
+    :return: tuple of compiled regular expression and replacement
+    """
+    regexp, replacement = substitution
+    return re.compile(regexp), replacement
 
 
 class MosesTokenizerExtended(MosesTokenizer):
@@ -13,6 +21,27 @@ class MosesTokenizerExtended(MosesTokenizer):
     CA_MIDDLE_DOT = r"([^{}\s\.'\`\,\-·])".format(MosesTokenizer.IsAlnum), r" \1 "
     CA_MIDDLE_DOT_NO_LOWER_FOLLOW = r"(·)([^a-z])", r"\1 · \2"
 
+    def __init__(self, lang="en", custom_nonbreaking_prefixes_file=None):
+        super(MosesTokenizerExtended, self).__init__(lang, custom_nonbreaking_prefixes_file)
+        # precompile the substitutions used in tokenize(), so the re module doesn't have to
+        # look up each pattern in its cache for each sentence;
+        # done after the super constructor, as it adapts some of the patterns to the language
+        self.compiled_deduplicate_space = compile_substitution(self.DEDUPLICATE_SPACE)
+        self.compiled_ascii_junk = compile_substitution(self.ASCII_JUNK)
+        self.compiled_ca_middle_dot = compile_substitution(self.CA_MIDDLE_DOT)
+        self.compiled_ca_middle_dot_no_lower_follow = compile_substitution(self.CA_MIDDLE_DOT_NO_LOWER_FOLLOW)
+        self.compiled_pad_not_isalnum = compile_substitution(self.PAD_NOT_ISALNUM)
+        self.compiled_aggressive_hyphen_split = compile_substitution(self.AGGRESSIVE_HYPHEN_SPLIT)
+        self.compiled_comma_separate = [
+            compile_substitution(substitution)
+            for substitution in [self.COMMA_SEPARATE_1, self.COMMA_SEPARATE_2, self.COMMA_SEPARATE_3]]
+        self.compiled_english_specific_apostrophe = [
+            compile_substitution(substitution) for substitution in self.ENGLISH_SPECIFIC_APOSTROPHE]
+        self.compiled_fr_it_specific_apostrophe = [
+            compile_substitution(substitution) for substitution in self.FR_IT_SPECIFIC_APOSTROPHE]
+        self.compiled_non_specific_apostrophe = compile_substitution(self.NON_SPECIFIC_APOSTROPHE)
+        self.compiled_trailing_dot_apostrophe = compile_substitution(self.TRAILING_DOT_APOSTROPHE)
+
     def tokenize(
             self,
             text,
@@ -30,11 +59,9 @@ class MosesTokenizerExtended(MosesTokenizer):
             :type aggressive_dash_splits: bool
         """
 
-        # Converts input string into unicode.
-        text = text_type(text)
         # De-duplicate spaces and clean ASCII junk
-        for regexp, substitution in [self.DEDUPLICATE_SPACE, self.ASCII_JUNK]:
-            text = re.sub(regexp, substitution, text)
+        for regexp, substitution in [self.compiled_deduplicate_space, self.compiled_ascii_junk]:
+            text = regexp.sub(substitution, text)
 
         if protected_patterns:
             # Find the tokens that needs to be protected.
@@ -43,9 +70,10 @@ class MosesTokenizerExtended(MosesTokenizer):
                 for protected_pattern in protected_patterns
                 for match in re.finditer(protected_pattern, text, re.IGNORECASE)
             ]
-            # Apply the protected_patterns.
-            for i, token in enumerate(protected_tokens):
-                substituition = "THISISPROTECTED" + str(i).zfill(3)
+            # Apply the protected_patterns; the placeholders are created once and reused for restoring.
+            protected_substitutions = [
+                (token, "THISISPROTECTED" + str(i).zfill(3)) for i, token in enumerate(protected_tokens)]
+            for token, substituition in protected_substitutions:
                 text = text.replace(token, substituition)
 
         # Strips heading and trailing spaces.
@@ -69,61 +97,56 @@ class MosesTokenizerExtended(MosesTokenizer):
         if self.lang in ["ca"]:
             # In Catalan, the middle dot can be used inside words:
             # il·lusio
-            regexp, substitution = self.CA_MIDDLE_DOT
-            text = re.sub(regexp, substitution, text)
+            regexp, substitution = self.compiled_ca_middle_dot
+            text = regexp.sub(substitution, text)
             # If a middle dot is not immediately followed by lower-case characters,
             # separate it out anyway.
-            regexp, substitution = self.CA_MIDDLE_DOT_NO_LOWER_FOLLOW
-            text = re.sub(regexp, substitution, text)
+            regexp, substitution = self.compiled_ca_middle_dot_no_lower_follow
+            text = regexp.sub(substitution, text)
         else:
             # Separate special characters outside of IsAlnum character set.
-            regexp, substitution = self.PAD_NOT_ISALNUM
-            text = re.sub(regexp, substitution, text)
+            regexp, substitution = self.compiled_pad_not_isalnum
+            text = regexp.sub(substitution, text)
 
         # Aggressively splits dashes
         if aggressive_dash_splits:
-            regexp, substitution = self.AGGRESSIVE_HYPHEN_SPLIT
-            text = re.sub(regexp, substitution, text)
+            regexp, substitution = self.compiled_aggressive_hyphen_split
+            text = regexp.sub(substitution, text)
 
         # Replaces multidots with "DOTDOTMULTI" literal strings.
         text = self.replace_multidots(text)
 
         # Separate out "," except if within numbers e.g. 5,300
-        for regexp, substitution in [
-            self.COMMA_SEPARATE_1,
-            self.COMMA_SEPARATE_2,
-            self.COMMA_SEPARATE_3,
-        ]:
-            text = re.sub(regexp, substitution, text)
+        for regexp, substitution in self.compiled_comma_separate:
+            text = regexp.sub(substitution, text)
 
         # (Language-specific) apostrophe tokenization.
         if self.lang == "en":
-            for regexp, substitution in self.ENGLISH_SPECIFIC_APOSTROPHE:
-                text = re.sub(regexp, substitution, text)
+            for regexp, substitution in self.compiled_english_specific_apostrophe:
+                text = regexp.sub(substitution, text)
         elif self.lang in ["fr", "it", "ca"]:
-            for regexp, substitution in self.FR_IT_SPECIFIC_APOSTROPHE:
-                text = re.sub(regexp, substitution, text)
+            for regexp, substitution in self.compiled_fr_it_specific_apostrophe:
+                text = regexp.sub(substitution, text)
         # FIXME!!!
         ##elif self.lang == "so":
         ##    for regexp, substitution in self.SO_SPECIFIC_APOSTROPHE:
         ##        text = re.sub(regexp, substitution, text)
         else:
-            regexp, substitution = self.NON_SPECIFIC_APOSTROPHE
-            text = re.sub(regexp, substitution, text)
+            regexp, substitution = self.compiled_non_specific_apostrophe
+            text = regexp.sub(substitution, text)
 
         # Handles nonbreaking prefixes.
         text = self.handles_nonbreaking_prefixes(text)
         # Cleans up extraneous spaces.
-        regexp, substitution = self.DEDUPLICATE_SPACE
-        text = re.sub(regexp, substitution, text).strip()
+        regexp, substitution = self.compiled_deduplicate_space
+        text = regexp.sub(substitution, text).strip()
         # Split trailing ".'".
-        regexp, substituition = self.TRAILING_DOT_APOSTROPHE
-        text = re.sub(regexp, substituition, text)
+        regexp, substituition = self.compiled_trailing_dot_apostrophe
+        text = regexp.sub(substituition, text)
 
         # Restore the protected tokens.
         if protected_patterns:
-            for i, token in enumerate(protected_tokens):
-                substituition = "THISISPROTECTED" + str(i).zfill(3)
+            for token, substituition in protected_substitutions:
                 text = text.replace(substituition, token)
 
         # Restore multidots.
@@ -140,17 +163,78 @@ class MosesDetokenizerExtended(MosesDetokenizer):
     Extended Moses detokenizer with Catalan support
     """
 
+    def __init__(self, lang="en"):
+        super(MosesDetokenizerExtended, self).__init__(lang)
+        if lang == 'ca':
+            # Catalan detokenization is simulated by first applying the French detokenizer
+            # and then the Spanish detokenizer
+            self.fr_detokenizer = MosesDetokenizer(lang='fr')
+            self.es_detokenizer = MosesDetokenizer(lang='es')
+
     def detokenize(self, tokens, return_str=True, unescape=True):
 
         if self.lang == 'ca':
-            # simulate Catalan detokenization by first applying the French detokenizer
-            # and then the Spanish detokenizer
-            self.lang = 'fr'
-            detokenized_text = self.tokenize(tokens, return_str, unescape)
+            detokenized_text = self.fr_detokenizer.tokenize(tokens, return_str, unescape)
             tokens = detokenized_text.split(" ")
-            self.lang = 'es'
-            detokenized_text = self.tokenize(tokens, return_str, unescape)
-            self.lang = 'ca'
-            return detokenized_text
+            return self.es_detokenizer.tokenize(tokens, return_str, unescape)
         else:
             return self.tokenize(tokens, return_str, unescape)
+
+
+class MosesPunctNormalizerExtended(MosesPunctNormalizer):
+    """
+    Moses punctuation normalizer with precompiled substitutions
+    """
+
+    def __init__(self, lang="en", penn=True, norm_quote_commas=True, norm_numbers=True,
+                 pre_replace_unicode_punct=False, post_remove_control_chars=False):
+        super(MosesPunctNormalizerExtended, self).__init__(
+            lang, penn, norm_quote_commas, norm_numbers, pre_replace_unicode_punct, post_remove_control_chars)
+        # precompile the substitutions used in normalize(), so the re module doesn't have to
+        # look up each pattern in its cache for each sentence
+        self.compiled_substitutions = [
+            compile_substitution(substitution) for substitution in self.substitutions]
+        # substitutions whose pattern contains non-ASCII characters never match ASCII text;
+        # the replacements of all other substitutions are ASCII, so ASCII text stays ASCII
+        self.compiled_ascii_substitutions = [
+            compile_substitution(substitution) for substitution in self.substitutions if substitution[0].isascii()]
+        # the unicode punctuation replacements of single characters are independent of each other,
+        # so they are applied together with a single translation table;
+        # the remaining replacements don't match any output of the single character replacements,
+        # so they can be applied before them
+        self.compiled_replace_unicode_punctuation = [
+            compile_substitution(substitution)
+            for substitution in self.REPLACE_UNICODE_PUNCTUATION if len(substitution[0]) > 1]
+        self.replace_unicode_punctuation_table = str.maketrans(
+            {regexp: replacement
+             for regexp, replacement in self.REPLACE_UNICODE_PUNCTUATION if len(regexp) == 1})
+
+    def normalize(self, text):
+        """
+        Returns a string with normalized punctuation.
+        """
+        # Optionally, replace unicode puncts BEFORE normalization.
+        if self.pre_replace_unicode_punct:
+            text = self.replace_unicode_punct(text)
+
+        # Actual normalization.
+        if text.isascii():
+            substitutions = self.compiled_ascii_substitutions
+        else:
+            substitutions = self.compiled_substitutions
+        for regexp, substitution in substitutions:
+            text = regexp.sub(substitution, text)
+
+        # Optionally, remove control characters AFTER normalization.
+        if self.post_remove_control_chars:
+            text = self.remove_control_chars(text)
+
+        return text
+
+    def replace_unicode_punct(self, text):
+        if text.isascii():
+            # all unicode punctuation replacements require a non-ASCII character
+            return text
+        for regexp, substitution in self.compiled_replace_unicode_punctuation:
+            text = regexp.sub(substitution, text)
+        return text.translate(self.replace_unicode_punctuation_table)